@@ -59,12 +59,25 @@ class Target:
     ...
 
 
+class MemoryError(RuntimeError):
+    ...
+
+
+class Inferior:
+    def read_memory(self, address: int, length: int) -> memoryview: ...
+
+    ...
+
+
 def lookup_type(type_name: str) -> Type: ...
 
 
 def parse_and_eval(expr: str) -> Value: ...
 
 
+def selected_inferior() -> Inferior: ...
+
+
 TYPE_CODE_STRUCT: int
 TYPE_CODE_UNION: int
 TYPE_CODE_PTR: int
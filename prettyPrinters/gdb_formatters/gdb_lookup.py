@@ -25,8 +25,8 @@ def is_old_enum(valobj):
 
 # Enum representation in gdb >= 10.1
 # Introduced in https://github.com/bminor/binutils-gdb/commit/9c6a1327ad9a92b8584f0501dd25bf8ba9e84ac6
-def is_new_enum(type):
-    fields = type.fields()
+def is_new_enum(fields):
+    # type: (list) -> bool
     if len(fields) > 1:
         field0 = fields[0]
         if field0.artificial and field0.name is None and field0.type.code == TYPE_CODE_INT:
@@ -34,13 +34,35 @@ def is_new_enum(type):
     return False
 
 
+# Rust types are immutable within a debug session, so classification results are cached.
+# The key includes the code and the size of the type, so that types of the same name
+# from different versions of a crate are not mixed up
+RUST_TYPE_CACHE = {}
+
+
 def classify_rust_type(type):
+    # type: (Type) -> RustType
+    name = type.name or type.tag
+    if name is None:
+        return classify_rust_type_uncached(type)
+
+    key = name, type.code, type.sizeof
+    rust_type = RUST_TYPE_CACHE.get(key)
+    if rust_type is None:
+        rust_type = classify_rust_type_uncached(type)
+        RUST_TYPE_CACHE[key] = rust_type
+    return rust_type
+
+
+def classify_rust_type_uncached(type):
     # type: (Type) -> RustType
     type_class = type.code
     if type_class == TYPE_CODE_STRUCT:
-        if is_new_enum(type):
+        # `Type.fields()` builds a new list of fields on each call, so it is called only once
+        fields = type.fields()
+        if is_new_enum(fields):
             return RustType.ENUM
-        return classify_struct(type.tag, type.fields())
+        return classify_struct(type.tag, fields)
     if type_class == TYPE_CODE_UNION:
         return classify_union(type.fields())
 
@@ -56,10 +78,12 @@ def lookup(valobj):
     if rust_type == RustType.TUPLE:
         return TupleProvider(valobj)
     if rust_type == RustType.ENUM:
-        if is_old_enum(valobj):
-            return OldEnumProvider(valobj)
-        elif is_new_enum(valobj.type):
+        # The new representation is checked first: it is the common one, and the check needs only the type,
+        # while `is_old_enum` reads the discriminant of the value
+        if is_new_enum(valobj.type.fields()):
             return NewEnumProvider(valobj)
+        elif is_old_enum(valobj):
+            return OldEnumProvider(valobj)
 
     if rust_type == RustType.STRING:
         return StdStringProvider(valobj)
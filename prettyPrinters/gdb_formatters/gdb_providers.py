@@ -1,8 +1,11 @@
+from itertools import chain
 from sys import version_info
 
 import gdb
 from gdb import Value
 
+from rust_types import index_name, is_valid_hash_table
+
 if version_info[0] >= 3:
     xrange = range
 
@@ -21,32 +24,40 @@ def unwrap_unique_or_non_null(unique_or_nonnull):
     return ptr if ptr.type.code == gdb.TYPE_CODE_PTR else ptr["pointer"]
 
 
+def dereference_elements(data_ptr, length):
+    # type: (Value, int) -> Iterator[Value]
+    """Yields lazy values of `length` elements starting at `data_ptr`"""
+    for index in xrange(length):
+        yield (data_ptr + index).dereference()
+
+
 class StructProvider:
     def __init__(self, valobj):
         # type: (Value) -> None
         self.valobj = valobj
-        self.fields = self.valobj.type.fields()
+        self.field_names = tuple(field.name for field in self.valobj.type.fields())
 
     def to_string(self):
         return self.valobj.type.name
 
     def children(self):
-        for field in self.fields:
-            yield field.name, self.valobj[field.name]
+        valobj = self.valobj
+        return [(name, valobj[name]) for name in self.field_names]
 
 
 class TupleProvider:
     def __init__(self, valobj):
         # type: (Value) -> None
         self.valobj = valobj
-        self.fields = self.valobj.type.fields()
+        self.field_names = tuple(field.name for field in self.valobj.type.fields())
+        self.indices = tuple(str(i) for i in xrange(len(self.field_names)))
 
     def to_string(self):
-        return "size={}".format(len(self.fields))
+        return "size={}".format(len(self.field_names))
 
     def children(self):
-        for i, field in enumerate(self.fields):
-            yield str(i), self.valobj[field.name]
+        valobj = self.valobj
+        return [(index, valobj[name]) for index, name in zip(self.indices, self.field_names)]
 
     @staticmethod
     def display_hint():
@@ -75,8 +86,7 @@ class OldEnumProvider:
         return self.full_name
 
     def children(self):
-        if not self.empty:
-            yield self.name, self.active_variant
+        return [] if self.empty else [(self.name, self.active_variant)]
 
 
 # gdb >= 10.1
@@ -99,7 +109,7 @@ class NewEnumProvider:
         return self.full_name
 
     def children(self):
-        yield self.name, self.active_variant
+        return [(self.name, self.active_variant)]
 
 
 class StdStringProvider:
@@ -172,7 +182,7 @@ class ArrayLikeProviderBase:
 
     def children(self):
         for index in xrange(self.length):
-            yield "[{}]".format(index), (self.data_ptr + index).dereference()
+            yield index_name(index), (self.data_ptr + index).dereference()
 
     @staticmethod
     def display_hint():
@@ -205,8 +215,9 @@ class StdVecDequeProvider:
         self.valobj = valobj
         self.head = int(valobj["head"])
         self.tail = int(valobj["tail"])
-        self.cap = int(valobj["buf"]["cap"])
-        self.data_ptr = unwrap_unique_or_non_null(valobj["buf"]["ptr"])
+        buf = valobj["buf"]
+        self.cap = int(buf["cap"])
+        self.data_ptr = unwrap_unique_or_non_null(buf["ptr"])
         if self.head >= self.tail:
             self.size = self.head - self.tail
         else:
@@ -216,8 +227,12 @@ class StdVecDequeProvider:
         return "size={}".format(self.size)
 
     def children(self):
-        for index in xrange(0, self.size):
-            yield "[{}]".format(index), (self.data_ptr + ((self.tail + index) % self.cap)).dereference()
+        # The elements occupy `[tail, tail + size)` of the ring buffer, wrapping around its end at most once
+        first_part_size = min(self.size, self.cap - self.tail)
+        first_part = dereference_elements(self.data_ptr + self.tail, first_part_size)
+        second_part = dereference_elements(self.data_ptr, self.size - first_part_size)
+        for index, element in enumerate(chain(first_part, second_part)):
+            yield index_name(index), element
 
     @staticmethod
     def display_hint():
@@ -229,17 +244,17 @@ class StdRcProvider:
         # type: (Value, bool) -> None
         self.valobj = valobj
         self.ptr = unwrap_unique_or_non_null(valobj["ptr"])
-        self.value = self.ptr["data" if is_atomic else "value"]
-        self.strong = self.ptr["strong"]["v" if is_atomic else "value"]["value"]
-        self.weak = self.ptr["weak"]["v" if is_atomic else "value"]["value"] - 1
+        inner = self.ptr.dereference()
+        cell_field = "v" if is_atomic else "value"
+        self.value = inner["data" if is_atomic else "value"]
+        self.strong = inner["strong"][cell_field]["value"]
+        self.weak = inner["weak"][cell_field]["value"] - 1
 
     def to_string(self):
         return "strong={}, weak={}".format(int(self.strong), int(self.weak))
 
     def children(self):
-        yield "value", self.value
-        yield "strong", self.strong
-        yield "weak", self.weak
+        return [("value", self.value), ("strong", self.strong), ("weak", self.weak)]
 
 
 class StdCellProvider:
@@ -247,7 +262,7 @@ class StdCellProvider:
         self.value = valobj["value"]["value"]
 
     def children(self):
-        yield "value", self.value
+        return [("value", self.value)]
 
 
 class StdRefProvider:
@@ -269,8 +284,7 @@ class StdRefProvider:
         return "borrow={}".format(borrow) if borrow >= 0 else "borrow_mut={}".format(-borrow)
 
     def children(self):
-        yield "*value", self.value
-        yield "borrow", self.borrow
+        return [("*value", self.value), ("borrow", self.borrow)]
 
 
 class StdRefCellProvider:
@@ -284,8 +298,7 @@ class StdRefCellProvider:
         return "borrow={}".format(borrow) if borrow >= 0 else "borrow_mut={}".format(-borrow)
 
     def children(self):
-        yield "value", self.value
-        yield "borrow", self.borrow
+        return [("value", self.value), ("borrow", self.borrow)]
 
 
 class StdNonZeroNumberProvider:
@@ -347,42 +360,72 @@ class StdRangeToInclusiveProvider:
         return "..={}".format(self.end)
 
 
+# Pointer types to `InternalNode`s by the name of the corresponding `LeafNode` type.
+# `gdb.lookup_type` searches the debug info, so it is called once per node type rather than once per node
+BTREE_INTERNAL_NODE_PTR_TYPES = {}
+
+
+class BTreeNodeFrame:
+    # A node on the stack of `children_of_btree_map`; `index` is the next key of the node to yield
+    def __init__(self, leaf, edges, height):
+        # type: (Value, Optional[Value], int) -> None
+        self.keys = leaf["keys"]
+        self.vals = leaf["vals"]
+        # Avoid "Cannot perform pointer math on incomplete type" on zero-sized arrays.
+        self.keys_are_sized = self.keys.type.sizeof > 0
+        self.vals_are_sized = self.vals.type.sizeof > 0
+        self.edges = edges
+        self.length = int(leaf["len"])
+        self.height = height
+        self.index = 0
+
+
 # Yields children (in a provider's sense of the word) for a BTreeMap.
 def children_of_btree_map(map):
-    # Yields each key/value pair in the node and in any child nodes.
-    def children_of_node(node_ptr, height):
-        def cast_to_internal(node):
-            # type: (Value) -> Value
-            internal_type_name = node.type.target().name.replace("LeafNode", "InternalNode", 1)
-            internal_type = gdb.lookup_type(internal_type_name)
-            return node.cast(internal_type.pointer())
-
-        node_ptr = unwrap_unique_or_non_null(node_ptr)
-        leaf = node_ptr.dereference()
-        keys = leaf["keys"]
-        vals = leaf["vals"]
-        edges = cast_to_internal(node_ptr)["edges"] if height > 0 else None
-        length = leaf["len"]
-
-        for i in xrange(0, length + 1):
-            if height > 0:
-                child_ptr = edges[i]["value"]["value"]
-                for child in children_of_node(child_ptr, height - 1):
-                    yield child
-            if i < length:
-                # Avoid "Cannot perform pointer math on incomplete type" on zero-sized arrays.
-                key = keys[i]["value"]["value"] if keys.type.sizeof > 0 else gdb.parse_and_eval("()")
-                val = vals[i]["value"]["value"] if vals.type.sizeof > 0 else gdb.parse_and_eval("()")
-                yield key, val
-
-    if map["length"] > 0:
+    # Yields each key/value pair of the tree in order.
+    # The tree is walked with an explicit stack of nodes instead of recursive generators.
+    def cast_to_internal(node):
+        # type: (Value) -> Value
+        leaf_type_name = node.type.target().name
+        internal_ptr_type = BTREE_INTERNAL_NODE_PTR_TYPES.get(leaf_type_name)
+        if internal_ptr_type is None:
+            internal_type_name = leaf_type_name.replace("LeafNode", "InternalNode", 1)
+            internal_ptr_type = gdb.lookup_type(internal_type_name).pointer()
+            BTREE_INTERNAL_NODE_PTR_TYPES[leaf_type_name] = internal_ptr_type
+        return node.cast(internal_ptr_type)
+
+    # Before the key `i` of a node is yielded, all the keys of its `edges[i]` subtree are yielded
+    def push_leftmost_path(node_ptr, height):
+        while True:
+            node_ptr = unwrap_unique_or_non_null(node_ptr)
+            leaf = node_ptr.dereference()
+            edges = cast_to_internal(node_ptr)["edges"] if height > 0 else None
+            stack.append(BTreeNodeFrame(leaf, edges, height))
+            if height == 0:
+                return
+            node_ptr = edges[0]["value"]["value"]
+            height -= 1
+
+    if int(map["length"]) > 0:
         root = map["root"]
         if root.type.name.startswith("core::option::Option<"):
             root = root.cast(gdb.lookup_type(root.type.name[21:-1]))
-        node_ptr = root["node"]
-        height = root["height"]
-        for child in children_of_node(node_ptr, height):
-            yield child
+
+        stack = []
+        push_leftmost_path(root["node"], int(root["height"]))
+        while stack:
+            frame = stack[-1]
+            i = frame.index
+            if i >= frame.length:
+                stack.pop()
+                continue
+
+            key = frame.keys[i]["value"]["value"] if frame.keys_are_sized else gdb.parse_and_eval("()")
+            val = frame.vals[i]["value"]["value"] if frame.vals_are_sized else gdb.parse_and_eval("()")
+            frame.index = i + 1
+            if frame.height > 0:
+                push_leftmost_path(frame.edges[i + 1]["value"]["value"], frame.height - 1)
+            yield key, val
 
 
 class StdBTreeSetProvider:
@@ -391,12 +434,12 @@ class StdBTreeSetProvider:
         self.valobj = valobj
 
     def to_string(self):
-        return "size={}".format(self.valobj["map"]["length"])
+        return "size={}".format(int(self.valobj["map"]["length"]))
 
     def children(self):
         inner_map = self.valobj["map"]
         for i, (child, _) in enumerate(children_of_btree_map(inner_map)):
-            yield "[{}]".format(i), child
+            yield index_name(i), child
 
     @staticmethod
     def display_hint():
@@ -409,7 +452,7 @@ class StdBTreeMapProvider:
         self.valobj = valobj
 
     def to_string(self):
-        return "size={}".format(self.valobj["length"])
+        return "size={}".format(int(self.valobj["length"]))
 
     def children(self):
         for i, (key, val) in enumerate(children_of_btree_map(self.valobj)):
@@ -442,13 +485,16 @@ class StdHashMapProvider:
         else:
             self.data_ptr = inner_table["data"]["pointer"]
 
+        # Control bytes are read at once instead of dereferencing each of them
         self.valid_indices = []
-        for idx in range(capacity):
-            address = ctrl + idx
-            value = address.dereference()
-            is_presented = value & 128 == 0
-            if is_presented:
-                self.valid_indices.append(idx)
+        if is_valid_hash_table(capacity, self.size):
+            try:
+                ctrl_bytes = gdb.selected_inferior().read_memory(int(ctrl), capacity)
+                self.valid_indices = [idx for idx, value in enumerate(bytearray(ctrl_bytes)) if value & 128 == 0]
+            except gdb.MemoryError:
+                pass
+        # Do not report children that cannot be read
+        self.size = min(self.size, len(self.valid_indices))
 
     def table(self):
         if self.show_values:
@@ -463,17 +509,20 @@ class StdHashMapProvider:
 
     def children(self):
         pairs_start = self.data_ptr
+        valid_indices = self.valid_indices
+        new_layout = self.new_layout
+        show_values = self.show_values
 
-        for index in range(self.size):
-            idx = self.valid_indices[index]
-            if self.new_layout:
+        for index in xrange(self.size):
+            idx = valid_indices[index]
+            if new_layout:
                 idx = -(idx + 1)
             element = (pairs_start + idx).dereference()
-            if self.show_values:
+            if show_values:
                 yield "key{}".format(index), element[ZERO_FIELD]
                 yield "val{}".format(index), element[FIRST_FIELD]
             else:
-                yield "[{}]".format(index), element[ZERO_FIELD]
+                yield index_name(index), element[ZERO_FIELD]
 
     def display_hint(self):
         return "map" if self.show_values else "array"
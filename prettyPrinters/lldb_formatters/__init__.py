@@ -1,4 +1,4 @@
-from rust_types import TYPE_TO_REGEX
+from rust_types import TYPE_TO_PATTERN
 from rust_types import RustType
 
 # noinspection PyUnresolvedReferences
@@ -9,7 +9,7 @@ from lldb_formatters.lldb_providers import *
 # noinspection DuplicatedCode
 def __lldb_init_module(debugger, _dict):
     def register_providers(rust_type, summary=None, synth=None):
-        regex = TYPE_TO_REGEX[rust_type].pattern
+        regex = TYPE_TO_PATTERN[rust_type]
 
         if summary:
             func_name = summary.__name__
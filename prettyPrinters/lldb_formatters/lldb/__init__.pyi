@@ -257,6 +257,12 @@ class SBValue:
 
 
 class SBTypeMember:
+    def GetName(self) -> str: ...
+
+    def GetType(self) -> SBType: ...
+
+    def GetOffsetInBytes(self) -> int: ...
+
     name: str
     type: SBType
 
@@ -276,6 +282,8 @@ class SBError:
 class SBData:
     def GetAddressByteSize(self) -> int: ...
 
+    def GetAddress(self, error: SBError, offset: int) -> int: ...
+
     def SetData(self, err: SBError, buffer: Any, endian: ByteOrder, size: int): ...
 
     def decode(self, encoding: str) -> SBData: ...
@@ -310,6 +318,8 @@ class SBProcess:
 
     def ReadPointerFromMemory(self, address: int, error: SBError) -> int: ...
 
+    def GetUniqueID(self) -> int: ...
+
     ...
 
 
@@ -2,7 +2,9 @@ import sys
 
 from lldb import LLDB_INVALID_ADDRESS
 from lldb import SBValue, SBData, SBDebugger, SBError
-from lldb import eBasicTypeLong, eBasicTypeUnsignedLong, eBasicTypeUnsignedChar, eBasicTypeChar
+from lldb import eBasicTypeLong, eBasicTypeUnsignedLong, eBasicTypeChar
+
+from rust_types import index_name, is_valid_hash_table
 
 #################################################################################################################
 # This file contains two kinds of pretty-printers: summary and synthetic.
@@ -94,8 +96,11 @@ def read_raw_string(data_ptr, length):
     start = data_ptr.GetValueAsUnsigned()
     error = SBError()
     data = process.ReadMemory(start, length_to_read, error)
-    data = data.decode(encoding='UTF-8') if PY3 else data
+    data = data.decode(encoding='UTF-8', errors='replace') if PY3 else data
 
+    # Mark truncated strings the same way as LLDB does for C strings
+    if length > length_to_read:
+        return '"%s"...' % data
     return '"%s"' % data
 
 
@@ -122,25 +127,39 @@ def extract_data_and_len_from_ffi_string(valobj):
     return data_ptr, length
 
 
+# Byte order and address size by process unique ID; both are fixed for the lifetime of a process
+PROCESS_INFO = {}
+
+
 class ValueBuilder:
+    __slots__ = ('valobj', 'endianness', 'pointer_size', 'long_type', 'unsigned_long_type')
+
     def __init__(self, valobj):
         # type: (SBValue) -> None
         self.valobj = valobj
         process = valobj.GetProcess()
-        self.endianness = process.GetByteOrder()
-        self.pointer_size = process.GetAddressByteSize()
+        process_id = process.GetUniqueID()
+        process_info = PROCESS_INFO.get(process_id)
+        if process_info is None:
+            process_info = process.GetByteOrder(), process.GetAddressByteSize()
+            PROCESS_INFO[process_id] = process_info
+        self.endianness, self.pointer_size = process_info
+        self.long_type = None
+        self.unsigned_long_type = None
 
     def from_int(self, name, value):
         # type: (str, int) -> SBValue
-        type = self.valobj.GetTarget().GetBasicType(eBasicTypeLong)
+        if self.long_type is None:
+            self.long_type = self.valobj.GetTarget().GetBasicType(eBasicTypeLong)
         data = SBData.CreateDataFromSInt64Array(self.endianness, self.pointer_size, [value])
-        return self.valobj.CreateValueFromData(name, data, type)
+        return self.valobj.CreateValueFromData(name, data, self.long_type)
 
     def from_uint(self, name, value):
         # type: (str, int) -> SBValue
-        type = self.valobj.GetTarget().GetBasicType(eBasicTypeUnsignedLong)
+        if self.unsigned_long_type is None:
+            self.unsigned_long_type = self.valobj.GetTarget().GetBasicType(eBasicTypeUnsignedLong)
         data = SBData.CreateDataFromUInt64Array(self.endianness, self.pointer_size, [value])
-        return self.valobj.CreateValueFromData(name, data, type)
+        return self.valobj.CreateValueFromData(name, data, self.unsigned_long_type)
 
 
 def SizeSummaryProvider(valobj, _dict):
@@ -191,9 +210,13 @@ def StdCStringSummaryProvider(valobj, _dict):
 
 
 class ArrayLikeSyntheticProviderBase:
+    __slots__ = ('valobj', 'length', 'data_ptr_addr', 'element_type', 'element_type_size')
+
     def __init__(self, valobj, _dict):
         # type: (SBValue, dict) -> None
         self.valobj = valobj
+        # The type of `valobj` does not change between updates, so subclasses may keep the element type
+        self.element_type = None
         self.update()
 
     def get_data_ptr(self):
@@ -206,27 +229,36 @@ class ArrayLikeSyntheticProviderBase:
 
     def num_children(self):
         # type: () -> int
+        if self.length is None:
+            self.length = self.get_length()
         return self.length
 
     def get_child_index(self, name):
         # type: (str) -> int
-        index = name.lstrip('[').rstrip(']')
-        if index.isdigit():
-            return int(index)
-        else:
+        try:
+            return int(name.strip('[]'))
+        except ValueError:
             return -1
 
+    def get_data_ptr_addr_and_element_type(self):
+        # type: () -> tuple[int, SBType, int]
+        data_ptr = self.get_data_ptr()
+        element_type = data_ptr.GetType().GetPointeeType()
+        return data_ptr.GetValueAsUnsigned(), element_type, element_type.GetByteSize()
+
     def get_child_at_index(self, index):
         # type: (int) -> SBValue
-        offset = index * self.element_type_size
-        return self.data_ptr.CreateChildAtOffset("[%s]" % index, offset, self.element_type)
+        if self.data_ptr_addr is None:
+            self.data_ptr_addr, self.element_type, self.element_type_size = self.get_data_ptr_addr_and_element_type()
+        address = self.data_ptr_addr + index * self.element_type_size
+        return self.valobj.CreateValueFromAddress(index_name(index), address, self.element_type)
 
     def update(self):
         # type: () -> None
-        self.data_ptr = self.get_data_ptr()
-        self.length = self.get_length()
-        self.element_type = self.data_ptr.GetType().GetPointeeType()
-        self.element_type_size = self.element_type.GetByteSize()
+        # LLDB calls `update` even when children are not needed (e.g. from `SBValue::GetName`),
+        # so the length and the data pointer are resolved on the first use
+        self.length = None
+        self.data_ptr_addr = None
 
     def has_children(self):
         # type: () -> bool
@@ -234,6 +266,8 @@ class ArrayLikeSyntheticProviderBase:
 
 
 class StdSliceSyntheticProvider(ArrayLikeSyntheticProviderBase):
+    __slots__ = ()
+
     def get_data_ptr(self):
         # type: () -> SBValue
         return self.valobj.GetChildMemberWithName("data_ptr")
@@ -253,10 +287,26 @@ class StdVecSyntheticProvider(ArrayLikeSyntheticProviderBase):
     struct NonNull<T> { pointer: *const T }
     """
 
+    __slots__ = ()
+
     def get_data_ptr(self):
         # type: () -> SBValue
         return get_vec_data_ptr(self.valobj)
 
+    def get_data_ptr_addr_and_element_type(self):
+        # type: () -> tuple[int, SBType, int]
+        if self.element_type is None:
+            element_type = self.valobj.GetType().GetTemplateArgumentType(0)
+            if not element_type.IsValid():
+                # MSVC LLDB (does not support template arguments at the moment)
+                return ArrayLikeSyntheticProviderBase.get_data_ptr_addr_and_element_type(self)
+            self.element_type, self.element_type_size = element_type, element_type.GetByteSize()
+
+        # The data pointer is the only non-zero-sized field of `Unique<T>` (and of `NonNull<T>` inside it),
+        # so it can be read from the beginning of `buf.ptr` without visiting the nested wrappers
+        ptr = self.valobj.GetChildMemberWithName("buf").GetChildMemberWithName("ptr")
+        return ptr.GetData().GetAddress(SBError(), 0), self.element_type, self.element_type_size
+
     def get_length(self):
         # type: () -> int
         return get_vec_length(self.valobj)
@@ -268,9 +318,14 @@ class StdVecDequeSyntheticProvider:
     struct VecDeque<T> { tail: usize, head: usize, buf: RawVec<T> }
     """
 
+    __slots__ = ('valobj', 'head', 'tail', 'buf', 'cap', 'size', 'data_ptr_addr', 'element_type',
+                 'element_type_size')
+
     def __init__(self, valobj, _dict):
         # type: (SBValue, dict) -> None
         self.valobj = valobj
+        # The type of `valobj` does not change between updates, so the element type is resolved only once
+        self.element_type = None
         self.update()
 
     def num_children(self):
@@ -279,17 +334,17 @@ class StdVecDequeSyntheticProvider:
 
     def get_child_index(self, name):
         # type: (str) -> int
-        index = name.lstrip('[').rstrip(']')
-        if index.isdigit() and self.tail <= int(index) and (self.tail + int(index)) % self.cap < self.head:
-            return int(index)
-        else:
+        try:
+            index = int(name.strip('[]'))
+        except ValueError:
             return -1
+        # Children are numbered from the logical start of the deque, so any index below `size` is valid
+        return index if 0 <= index < self.size else -1
 
     def get_child_at_index(self, index):
         # type: (int) -> SBValue
-        start = self.data_ptr.GetValueAsUnsigned()
-        address = start + ((index + self.tail) % self.cap) * self.element_type_size
-        element = self.data_ptr.CreateValueFromAddress("[%s]" % index, address, self.element_type)
+        address = self.data_ptr_addr + ((index + self.tail) % self.cap) * self.element_type_size
+        element = self.valobj.CreateValueFromAddress(index_name(index), address, self.element_type)
         return element
 
     def update(self):
@@ -299,9 +354,16 @@ class StdVecDequeSyntheticProvider:
         self.buf = self.valobj.GetChildMemberWithName("buf")
         self.cap = self.buf.GetChildMemberWithName("cap").GetValueAsUnsigned()
         self.size = self.head - self.tail if self.head >= self.tail else self.cap + self.head - self.tail
-        self.data_ptr = unwrap_unique_or_non_null(self.buf.GetChildMemberWithName("ptr"))
-        self.element_type = self.data_ptr.GetType().GetPointeeType()
-        self.element_type_size = self.element_type.GetByteSize()
+
+        ptr = self.buf.GetChildMemberWithName("ptr")
+        if self.element_type is None:
+            element_type = self.valobj.GetType().GetTemplateArgumentType(0)
+            if not element_type.IsValid():
+                # MSVC LLDB (does not support template arguments at the moment)
+                element_type = unwrap_unique_or_non_null(ptr).GetType().GetPointeeType()
+            self.element_type, self.element_type_size = element_type, element_type.GetByteSize()
+        # See `StdVecSyntheticProvider.get_data_ptr_addr_and_element_type`
+        self.data_ptr_addr = ptr.GetData().GetAddress(SBError(), 0)
 
     def has_children(self):
         # type: () -> bool
@@ -311,10 +373,15 @@ class StdVecDequeSyntheticProvider:
 class StdHashMapSyntheticProvider:
     """Pretty-printer for hashbrown's HashMap"""
 
+    __slots__ = ('valobj', 'show_values', 'size', 'valid_indices', 'pair_type', 'pair_type_size', 'key_type',
+                 'key_offset', 'new_layout', 'data_ptr', 'data_ptr_addr')
+
     def __init__(self, valobj, _dict, show_values=True):
         # type: (SBValue, dict, bool) -> None
         self.valobj = valobj
         self.show_values = show_values
+        # The type of `valobj` does not change between updates, so the layout of the pairs is resolved only once
+        self.pair_type = None
         self.update()
 
     def num_children(self):
@@ -323,27 +390,34 @@ class StdHashMapSyntheticProvider:
 
     def get_child_index(self, name):
         # type: (str) -> int
-        index = name.lstrip('[').rstrip(']')
-        if index.isdigit():
-            return int(index)
-        else:
+        try:
+            return int(name.strip('[]'))
+        except ValueError:
             return -1
 
     def get_child_at_index(self, index):
-        # type: (int) -> SBValue
-        pairs_start = self.data_ptr.GetValueAsUnsigned()
+        # type: (int) -> Optional[SBValue]
+        if self.valid_indices is None:
+            self.resolve_layout()
+        if index >= len(self.valid_indices):
+            return None
         idx = self.valid_indices[index]
         if self.new_layout:
             idx = -(idx + 1)
-        address = pairs_start + idx * self.pair_type_size
-        element = self.data_ptr.CreateValueFromAddress("[%s]" % index, address, self.pair_type)
+        address = self.data_ptr_addr + idx * self.pair_type_size
         if self.show_values:
-            return element
+            return self.data_ptr.CreateValueFromAddress(index_name(index), address, self.pair_type)
         else:
-            key = element.GetChildAtIndex(0)
-            return self.valobj.CreateValueFromData("[%s]" % index, key.GetData(), key.GetType())
+            # Point directly at the key instead of copying its data out of the pair
+            return self.data_ptr.CreateValueFromAddress(index_name(index), address + self.key_offset, self.key_type)
 
     def update(self):
+        # type: () -> None
+        self.size = self.table().GetChildMemberWithName("table").GetChildMemberWithName("items").GetValueAsUnsigned()
+        # The summary needs only the size, so the layout and the control bytes are read on the first child access
+        self.valid_indices = None
+
+    def resolve_layout(self):
         # type: () -> None
         table = self.table()
         inner_table = table.GetChildMemberWithName("table")
@@ -351,8 +425,28 @@ class StdHashMapSyntheticProvider:
         capacity = inner_table.GetChildMemberWithName("bucket_mask").GetValueAsUnsigned() + 1
         ctrl = inner_table.GetChildMemberWithName("ctrl").GetChildAtIndex(0)
 
-        self.size = inner_table.GetChildMemberWithName("items").GetValueAsUnsigned()
+        if self.pair_type is None:
+            self.resolve_pair_type(table)
 
+        self.new_layout = not inner_table.GetChildMemberWithName("data").IsValid()
+        if self.new_layout:
+            self.data_ptr = ctrl.Cast(self.pair_type.GetPointerType())
+        else:
+            self.data_ptr = inner_table.GetChildMemberWithName("data").GetChildAtIndex(0)
+        self.data_ptr_addr = self.data_ptr.GetValueAsUnsigned()
+
+        # Control bytes are read at once instead of creating an `SBValue` for each of them
+        self.valid_indices = []
+        if is_valid_hash_table(capacity, self.size):
+            error = SBError()
+            ctrl_bytes = self.valobj.GetProcess().ReadMemory(ctrl.GetValueAsUnsigned(), capacity, error)
+            if error.Success():
+                self.valid_indices = [idx for idx, value in enumerate(bytearray(ctrl_bytes)) if value & 128 == 0]
+        # Do not report children that cannot be read
+        self.size = min(self.size, len(self.valid_indices))
+
+    def resolve_pair_type(self, table):
+        # type: (SBValue) -> None
         if table.type.GetNumberOfTemplateArguments() > 0:
             self.pair_type = table.type.template_args[0].GetTypedefedType()
         else:
@@ -362,24 +456,10 @@ class StdHashMapSyntheticProvider:
             self.pair_type = table.GetTarget().FindTypes(first_template_arg).GetTypeAtIndex(0)
 
         self.pair_type_size = self.pair_type.GetByteSize()
-
-        self.new_layout = not inner_table.GetChildMemberWithName("data").IsValid()
-        if self.new_layout:
-            self.data_ptr = ctrl.Cast(self.pair_type.GetPointerType())
-        else:
-            self.data_ptr = inner_table.GetChildMemberWithName("data").GetChildAtIndex(0)
-
-        u8_type = self.valobj.GetTarget().GetBasicType(eBasicTypeUnsignedChar)
-        u8_type_size = self.valobj.GetTarget().GetBasicType(eBasicTypeUnsignedChar).GetByteSize()
-
-        self.valid_indices = []
-        for idx in range(capacity):
-            address = ctrl.GetValueAsUnsigned() + idx * u8_type_size
-            value = ctrl.CreateValueFromAddress("ctrl[%s]" % idx, address,
-                                                u8_type).GetValueAsUnsigned()
-            is_present = value & 128 == 0
-            if is_present:
-                self.valid_indices.append(idx)
+        if not self.show_values:
+            key_field = self.pair_type.GetFieldAtIndex(0)
+            self.key_type = key_field.GetType()
+            self.key_offset = key_field.GetOffsetInBytes()
 
     def table(self):
         # type: () -> SBValue
@@ -396,6 +476,8 @@ class StdHashMapSyntheticProvider:
 
 
 class StdHashSetSyntheticProvider(StdHashMapSyntheticProvider):
+    __slots__ = ()
+
     def __init__(self, valobj, _dict):
         super().__init__(valobj, _dict, show_values=False)
 
@@ -421,6 +503,9 @@ class StdRcSyntheticProvider:
     struct AtomicUsize { v: UnsafeCell<usize> }
     """
 
+    __slots__ = ('valobj', 'ptr', 'value', 'strong', 'weak', 'value_builder', 'strong_count', 'weak_count',
+                 'strong_value', 'weak_value')
+
     def __init__(self, valobj, _dict, is_atomic=False):
         # type: (SBValue, dict, bool) -> None
         self.valobj = valobj
@@ -451,9 +536,13 @@ class StdRcSyntheticProvider:
         if index == 0:
             return self.value
         if index == 1:
-            return self.value_builder.from_uint("strong", self.strong_count)
+            if self.strong_value is None:
+                self.strong_value = self.value_builder.from_uint("strong", self.strong_count)
+            return self.strong_value
         if index == 2:
-            return self.value_builder.from_uint("weak", self.weak_count)
+            if self.weak_value is None:
+                self.weak_value = self.value_builder.from_uint("weak", self.weak_count)
+            return self.weak_value
 
         return None
 
@@ -461,6 +550,9 @@ class StdRcSyntheticProvider:
         # type: () -> None
         self.strong_count = self.strong.GetValueAsUnsigned()
         self.weak_count = self.weak.GetValueAsUnsigned() - 1
+        # Values of the counts are built on the first access and reused until the next update
+        self.strong_value = None
+        self.weak_value = None
 
     def has_children(self):
         # type: () -> bool
@@ -468,6 +560,8 @@ class StdRcSyntheticProvider:
 
 
 class StdArcSyntheticProvider(StdRcSyntheticProvider):
+    __slots__ = ()
+
     def __init__(self, valobj, _dict):
         super().__init__(valobj, _dict, is_atomic=True)
 
@@ -475,6 +569,8 @@ class StdArcSyntheticProvider(StdRcSyntheticProvider):
 class StdCellSyntheticProvider:
     """Pretty-printer for std::cell::Cell"""
 
+    __slots__ = ('valobj', 'value')
+
     def __init__(self, valobj, _dict):
         # type: (SBValue, dict) -> None
         self.valobj = valobj
@@ -514,6 +610,8 @@ def StdRefSummaryProvider(valobj, _dict):
 class StdRefSyntheticProvider:
     """Pretty-printer for std::cell::Ref, std::cell::RefMut, and std::cell::RefCell"""
 
+    __slots__ = ('valobj', 'borrow', 'value', 'value_builder', 'borrow_count', 'borrow_value')
+
     def __init__(self, valobj, _dict, is_cell=False):
         # type: (SBValue, dict, bool) -> None
         self.valobj = valobj
@@ -556,12 +654,15 @@ class StdRefSyntheticProvider:
         if index == 0:
             return self.value
         if index == 1:
-            return self.value_builder.from_int("borrow", self.borrow_count)
+            if self.borrow_value is None:
+                self.borrow_value = self.value_builder.from_int("borrow", self.borrow_count)
+            return self.borrow_value
         return None
 
     def update(self):
         # type: () -> None
         self.borrow_count = self.borrow.GetValueAsSigned()
+        self.borrow_value = None
 
     def has_children(self):
         # type: () -> bool
@@ -569,16 +670,16 @@ class StdRefSyntheticProvider:
 
 
 class StdRefCellSyntheticProvider(StdRefSyntheticProvider):
+    __slots__ = ()
+
     def __init__(self, valobj, _dict):
         super().__init__(valobj, _dict, is_cell=True)
 
 
 def StdNonZeroNumberSummaryProvider(valobj, _dict):
     # type: (SBValue, dict) -> str
-    objtype = valobj.GetType()
-    field = objtype.GetFieldAtIndex(0)
-    element = valobj.GetChildMemberWithName(field.name)
-    return element.GetValue()
+    # NonZero* have no synthetic children, so the only field is the first child
+    return valobj.GetChildAtIndex(0).GetValue()
 
 
 def StdRangeSummaryProvider(valobj, _dict):
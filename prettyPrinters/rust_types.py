@@ -2,129 +2,215 @@ import re
 
 
 class RustType(object):
-    OTHER = "Other"
-    STRUCT = "Struct"
-    TUPLE = "Tuple"
-    CSTYLE_VARIANT = "CStyleVariant"
-    TUPLE_VARIANT = "TupleVariant"
-    STRUCT_VARIANT = "StructVariant"
-    ENUM = "Enum"
-    EMPTY = "Empty"
-    SINGLETON_ENUM = "SingletonEnum"
-    REGULAR_ENUM = "RegularEnum"
-    COMPRESSED_ENUM = "CompressedEnum"
-    REGULAR_UNION = "RegularUnion"
-
-    STRING = "String"
-    OS_STRING = "OsString"
-    PATH_BUF = "PathBuf"
-    STR = "Str"
-    MSVC_STR = "StdMsvcStr"
-    MSVC_STR_DOLLAR = "StdMsvcStrDollar"
-    SLICE = "Slice"
-    MSVC_SLICE = "MsvcSlice"
-    MSVC_SLICE2 = "StdMsvcSlice2"
-    OS_STR = "OsStr"
-    PATH = "Path"
-    CSTRING = "CString"
-    CSTR = "CStr"
-    VEC = "Vec"
-    VEC_DEQUE = "VecDeque"
-    BTREE_SET = "BTreeSet"
-    BTREE_MAP = "BTreeMap"
-    HASH_MAP = "HashMap"
-    HASH_SET = "HashSet"
-    RC = "Rc"
-    RC_WEAK = "RcWeak"
-    ARC = "Arc"
-    ARC_WEAK = "ArcWeak"
-    CELL = "Cell"
-    REF = "Ref"
-    REF_MUT = "RefMut"
-    REF_CELL = "RefCell"
-    NONZERO_NUMBER = "NonZeroNumber"
-    RANGE = "Range"
-    RANGE_FROM = "RangeFrom"
-    RANGE_INCLUSIVE = "RangeInclusive"
-    RANGE_TO = "RangeTo"
-    RANGE_TO_INCLUSIVE = "RangeToInclusive"
-
-
-TUPLE_ITEM_REGEX = re.compile(r"__\d+$")
+    # Plain ints are compared faster than strings when dispatching on the kind of a type
+    OTHER = 0
+    STRUCT = 1
+    TUPLE = 2
+    CSTYLE_VARIANT = 3
+    TUPLE_VARIANT = 4
+    STRUCT_VARIANT = 5
+    ENUM = 6
+    EMPTY = 7
+    SINGLETON_ENUM = 8
+    REGULAR_ENUM = 9
+    COMPRESSED_ENUM = 10
+    REGULAR_UNION = 11
+
+    STRING = 12
+    OS_STRING = 13
+    PATH_BUF = 14
+    STR = 15
+    MSVC_STR = 16
+    MSVC_STR_DOLLAR = 17
+    SLICE = 18
+    MSVC_SLICE = 19
+    MSVC_SLICE2 = 20
+    OS_STR = 21
+    PATH = 22
+    CSTRING = 23
+    CSTR = 24
+    VEC = 25
+    VEC_DEQUE = 26
+    BTREE_SET = 27
+    BTREE_MAP = 28
+    HASH_MAP = 29
+    HASH_SET = 30
+    RC = 31
+    RC_WEAK = 32
+    ARC = 33
+    ARC_WEAK = 34
+    CELL = 35
+    REF = 36
+    REF_MUT = 37
+    REF_CELL = 38
+    NONZERO_NUMBER = 39
+    RANGE = 40
+    RANGE_FROM = 41
+    RANGE_INCLUSIVE = 42
+    RANGE_TO = 43
+    RANGE_TO_INCLUSIVE = 44
+
 
 ENCODED_ENUM_PREFIX = "RUST$ENCODED$ENUM$"
+# Names are checked for the prefix by comparing a slice, which is cheaper than calling `startswith`
+ENCODED_ENUM_PREFIX_LENGTH = len(ENCODED_ENUM_PREFIX)
 ENUM_DISR_FIELD_NAME = "<<variant>>"
 
-TYPE_TO_REGEX = {
+# Names of the first children of array-like values, so that they are not formatted for every child
+INDEX_NAMES = tuple("[{}]".format(index) for index in range(1024))
+
+# Hash tables with more buckets are treated as uninitialized or corrupted, see `is_valid_hash_table`
+HASH_TABLE_CAPACITY_LIMIT = 1 << 24
+
+TYPE_TO_PATTERN = {
     # &str, &mut str, *const str, *mut str
-    RustType.STR: re.compile(r"^(&|&mut |\*const |\*mut )str$"),
+    RustType.STR: r"^(&|&mut |\*const |\*mut )str$",
 
     # BACKCOMPAT: Rust 1.66
     # str, ptr_const$<str>, ptr_mut$<str>
-    RustType.MSVC_STR: re.compile(r"^(str)|((ptr_const|ptr_mut)\$<str>)$"),
+    RustType.MSVC_STR: r"^(str)|((ptr_const|ptr_mut)\$<str>)$",
 
     # Since Rust 1.67 https://github.com/rust-lang/rust/pull/103691
     # str$, ref$<str$>, ref_mut$<str$>, ptr_const$<str$>, ptr_mut$<str$>
-    RustType.MSVC_STR_DOLLAR: re.compile(r"^(str\$)|((ref|ref_mut|ptr_const|ptr_mut)\$<str\$>)$"),
+    RustType.MSVC_STR_DOLLAR: r"^(str\$)|((ref|ref_mut|ptr_const|ptr_mut)\$<str\$>)$",
 
     # &[T], &mut [T], *const [T], *mut [T], but not fixed-sized like &[T;size] because they have native representations
-    RustType.SLICE: re.compile(r"^(&|&mut |\*const |\*mut )?\[[^;]+]$"),
+    RustType.SLICE: r"^(&|&mut |\*const |\*mut )?\[[^;]+]$",
 
     # BACKCOMPAT: Rust 1.66
     # slice$<T>, ptr_const$<slice$<T> >, ptr_mut$<slice$<T> >
-    RustType.MSVC_SLICE: re.compile(r"^(slice\$<.+>)|((ptr_const|ptr_mut)\$<slice\$<.+> >)$"),
+    RustType.MSVC_SLICE: r"^(slice\$<.+>)|((ptr_const|ptr_mut)\$<slice\$<.+> >)$",
 
     # Since Rust 1.67 https://github.com/rust-lang/rust/pull/103691
     # slice2$<T>, ref$<slice2$<T> >, ref_mut$<slice2$<T> >, ptr_const$<slice2$<T> >, ptr_mut$<slice2$<T> >
-    RustType.MSVC_SLICE2: re.compile(r"^(slice2\$<.+>)|((ref|ref_mut|ptr_const|ptr_mut)\$<slice2\$<.+> >?)$"),
-
-    RustType.STRING: re.compile(r"^(alloc::([a-z_]+::)+)String$"),
-    RustType.OS_STRING: re.compile(r"^(std::ffi::([a-z_]+::)+)OsString$"),
-    RustType.OS_STR: re.compile(r"^((&|&mut )?std::ffi::([a-z_]+::)+)OsStr( \*)?$"),
-    RustType.PATH_BUF: re.compile(r"^(std::([a-z_]+::)+)PathBuf$"),
-    RustType.PATH: re.compile(r"^(&?std::([a-z_]+::)+)Path( \*)?$"),
-    RustType.CSTRING: re.compile(r"^((std|alloc)::ffi::([a-z_]+::)+)CString$"),
-    RustType.CSTR: re.compile(r"^(&?(std|core)::ffi::([a-z_]+::)+)CStr( \*)?$"),
-
-    RustType.VEC: re.compile(r"^(alloc::([a-z_]+::)+)Vec<.+>$"),
-    RustType.VEC_DEQUE: re.compile(r"^(alloc::([a-z_]+::)+)VecDeque<.+>$"),
-    RustType.HASH_MAP: re.compile(r"^(std::collections::([a-z_]+::)+)HashMap<.+>$"),
-    RustType.HASH_SET: re.compile(r"^(std::collections::([a-z_]+::)+)HashSet<.+>$"),
-    RustType.BTREE_MAP: re.compile(r"^(alloc::([a-z_]+::)+)BTreeMap<.+>$"),
-    RustType.BTREE_SET: re.compile(r"^(alloc::([a-z_]+::)+)BTreeSet<.+>$"),
-
-    RustType.RC: re.compile(r"^alloc::rc::Rc<.+>$"),
-    RustType.RC_WEAK: re.compile(r"^alloc::rc::Weak<.+>$"),
-    RustType.ARC: re.compile(r"^alloc::(sync|arc)::Arc<.+>$"),
-    RustType.ARC_WEAK: re.compile(r"^alloc::(sync|arc)::Weak<.+>$"),
-
-    RustType.CELL: re.compile(r"^(core::([a-z_]+::)+)Cell<.+>$"),
-    RustType.REF: re.compile(r"^(core::([a-z_]+::)+)Ref<.+>$"),
-    RustType.REF_MUT: re.compile(r"^(core::([a-z_]+::)+)RefMut<.+>$"),
-    RustType.REF_CELL: re.compile(r"^(core::([a-z_]+::)+)RefCell<.+>$"),
-
-    RustType.NONZERO_NUMBER: re.compile(r"^core::num::([a-z_]+::)*NonZero.+$"),
-
-    RustType.RANGE: re.compile(r"^core::ops::range::Range<.+>$"),
-    RustType.RANGE_FROM: re.compile(r"^core::ops::range::RangeFrom<.+>$"),
-    RustType.RANGE_INCLUSIVE: re.compile(r"^core::ops::range::RangeInclusive<.+>$"),
-    RustType.RANGE_TO: re.compile(r"^core::ops::range::RangeTo<.+>$"),
-    RustType.RANGE_TO_INCLUSIVE: re.compile(r"^core::ops::range::RangeToInclusive<.+>$"),
+    RustType.MSVC_SLICE2: r"^(slice2\$<.+>)|((ref|ref_mut|ptr_const|ptr_mut)\$<slice2\$<.+> >?)$",
+
+    RustType.STRING: r"^(alloc::([a-z_]+::)+)String$",
+    RustType.OS_STRING: r"^(std::ffi::([a-z_]+::)+)OsString$",
+    RustType.OS_STR: r"^((&|&mut )?std::ffi::([a-z_]+::)+)OsStr( \*)?$",
+    RustType.PATH_BUF: r"^(std::([a-z_]+::)+)PathBuf$",
+    RustType.PATH: r"^(&?std::([a-z_]+::)+)Path( \*)?$",
+    RustType.CSTRING: r"^((std|alloc)::ffi::([a-z_]+::)+)CString$",
+    RustType.CSTR: r"^(&?(std|core)::ffi::([a-z_]+::)+)CStr( \*)?$",
+
+    RustType.VEC: r"^(alloc::([a-z_]+::)+)Vec<.+>$",
+    RustType.VEC_DEQUE: r"^(alloc::([a-z_]+::)+)VecDeque<.+>$",
+    RustType.HASH_MAP: r"^(std::collections::([a-z_]+::)+)HashMap<.+>$",
+    RustType.HASH_SET: r"^(std::collections::([a-z_]+::)+)HashSet<.+>$",
+    RustType.BTREE_MAP: r"^(alloc::([a-z_]+::)+)BTreeMap<.+>$",
+    RustType.BTREE_SET: r"^(alloc::([a-z_]+::)+)BTreeSet<.+>$",
+
+    RustType.RC: r"^alloc::rc::Rc<.+>$",
+    RustType.RC_WEAK: r"^alloc::rc::Weak<.+>$",
+    RustType.ARC: r"^alloc::(sync|arc)::Arc<.+>$",
+    RustType.ARC_WEAK: r"^alloc::(sync|arc)::Weak<.+>$",
+
+    RustType.CELL: r"^(core::([a-z_]+::)+)Cell<.+>$",
+    RustType.REF: r"^(core::([a-z_]+::)+)Ref<.+>$",
+    RustType.REF_MUT: r"^(core::([a-z_]+::)+)RefMut<.+>$",
+    RustType.REF_CELL: r"^(core::([a-z_]+::)+)RefCell<.+>$",
+
+    RustType.NONZERO_NUMBER: r"^core::num::([a-z_]+::)*NonZero.+$",
+
+    RustType.RANGE: r"^core::ops::range::Range<.+>$",
+    RustType.RANGE_FROM: r"^core::ops::range::RangeFrom<.+>$",
+    RustType.RANGE_INCLUSIVE: r"^core::ops::range::RangeInclusive<.+>$",
+    RustType.RANGE_TO: r"^core::ops::range::RangeTo<.+>$",
+    RustType.RANGE_TO_INCLUSIVE: r"^core::ops::range::RangeToInclusive<.+>$",
+}
+
+STD_TYPES = list(TYPE_TO_PATTERN.keys())
+
+# Std types whose patterns can match a name starting with the prefix.
+# Every pattern of `TYPE_TO_PATTERN` can only match a name starting with one of these prefixes,
+# and a name can start with only one of them. Keep in sync with `TYPE_TO_PATTERN`, which is checked on import
+STD_TYPES_BY_PREFIX = {
+    "&": (RustType.STR, RustType.SLICE, RustType.OS_STR, RustType.PATH, RustType.CSTR),
+    "*": (RustType.STR, RustType.SLICE),
+    "[": (RustType.SLICE,),
+    "str": (RustType.MSVC_STR, RustType.MSVC_STR_DOLLAR),
+    "ptr_": (RustType.MSVC_STR, RustType.MSVC_STR_DOLLAR, RustType.MSVC_SLICE, RustType.MSVC_SLICE2),
+    "ref": (RustType.MSVC_STR_DOLLAR, RustType.MSVC_SLICE2),
+    "slice": (RustType.MSVC_SLICE, RustType.MSVC_SLICE2),
+    "alloc::": (RustType.STRING, RustType.CSTRING, RustType.VEC, RustType.VEC_DEQUE, RustType.BTREE_MAP,
+                RustType.BTREE_SET, RustType.RC, RustType.RC_WEAK, RustType.ARC, RustType.ARC_WEAK),
+    "std::": (RustType.OS_STRING, RustType.OS_STR, RustType.PATH_BUF, RustType.PATH, RustType.CSTRING, RustType.CSTR,
+              RustType.HASH_MAP, RustType.HASH_SET),
+    "core::": (RustType.CSTR, RustType.CELL, RustType.REF, RustType.REF_MUT, RustType.REF_CELL, RustType.NONZERO_NUMBER,
+               RustType.RANGE, RustType.RANGE_FROM, RustType.RANGE_INCLUSIVE, RustType.RANGE_TO,
+               RustType.RANGE_TO_INCLUSIVE),
+}
+assert set(STD_TYPES) == set(ty for types in STD_TYPES_BY_PREFIX.values() for ty in types), \
+    "Every type of `TYPE_TO_PATTERN` must be listed in `STD_TYPES_BY_PREFIX`"
+
+# Prefixes of `STD_TYPES_BY_PREFIX` by their first character, so that a name is checked only for a few of them
+STD_TYPE_PREFIXES_BY_FIRST_CHAR = {
+    char: tuple(prefix for prefix in STD_TYPES_BY_PREFIX if prefix[0] == char)
+    for char in set(prefix[0] for prefix in STD_TYPES_BY_PREFIX)
+}
+
+# Regexes matching names with a prefix against the patterns of its std types at once, and these types.
+# They are compiled on the first name with the prefix, see `compile_std_type_regex`
+STD_TYPE_REGEXES = {}
+
+# The most common names of std types, which are known without matching the std type regexes.
+# Each entry must give the same result as the regexes.
+# Results for other names are not cached here: callers cache the classification of whole types
+STD_TYPE_NAMES = {
+    "&str": RustType.STR,
+    "&mut str": RustType.STR,
+    "*const str": RustType.STR,
+    "*mut str": RustType.STR,
+    "alloc::string::String": RustType.STRING,
 }
 
 
+def compile_std_type_regex(prefix):
+    # type: (str) -> tuple
+    # Branches are tried in the same order as in `TYPE_TO_PATTERN`; the group `i + 1` corresponds to `types[i]`.
+    # `TYPE_TO_PATTERN` is also used by LLDB, which does not support non-capturing groups, so its groups are made
+    # non-capturing only here. Then each branch has a single group, which is `match.lastindex` when it matches
+    types = tuple(ty for ty in STD_TYPES if ty in STD_TYPES_BY_PREFIX[prefix])
+    regex = re.compile("|".join(
+        "({})".format(re.sub(r"(?<!\\)\((?!\?)", "(?:", TYPE_TO_PATTERN[ty])) for ty in types
+    ))
+    STD_TYPE_REGEXES[prefix] = regex, types
+    return regex, types
+
+
+def classify_std_type(name):
+    # type: (str) -> Optional[int]
+    ty = STD_TYPE_NAMES.get(name)
+    if ty is not None:
+        return ty
+
+    for prefix in STD_TYPE_PREFIXES_BY_FIRST_CHAR.get(name[:1], ()):
+        if name.startswith(prefix):
+            regex, types = STD_TYPE_REGEXES.get(prefix) or compile_std_type_regex(prefix)
+            match = regex.match(name)
+            if match:
+                ty = types[match.lastindex - 1]
+            break
+    return ty
+
+
 def is_tuple_fields(fields):
     # type: (list) -> bool
-    return all(TUPLE_ITEM_REGEX.match(str(field.name)) for field in fields)
+    # Tuple items are named `__0`, `__1`, ...
+    for field in fields:
+        name = field.name
+        if not name or not name.startswith("__") or not name[2:].isdigit():
+            return False
+    return True
 
 
 def classify_struct(name, fields):
-    if len(fields) == 0:
+    if not fields:
         return RustType.EMPTY
 
-    for ty, regex in TYPE_TO_REGEX.items():
-        if regex.match(name):
-            return ty
+    ty = classify_std_type(name)
+    if ty is not None:
+        return ty
 
     if fields[0].name == ENUM_DISR_FIELD_NAME:
         return RustType.ENUM
@@ -136,7 +222,7 @@ def classify_struct(name, fields):
 
 
 def classify_union(fields):
-    if len(fields) == 0:
+    if not fields:
         return RustType.EMPTY
 
     first_variant_name = fields[0].name
@@ -145,8 +231,20 @@ def classify_union(fields):
             return RustType.SINGLETON_ENUM
         else:
             return RustType.REGULAR_ENUM
-    elif first_variant_name.startswith(ENCODED_ENUM_PREFIX):
+    elif first_variant_name[:ENCODED_ENUM_PREFIX_LENGTH] == ENCODED_ENUM_PREFIX:
         assert len(fields) == 1
         return RustType.COMPRESSED_ENUM
     else:
         return RustType.REGULAR_UNION
+
+
+def index_name(index):
+    # type: (int) -> str
+    return INDEX_NAMES[index] if index < len(INDEX_NAMES) else "[{}]".format(index)
+
+
+def is_valid_hash_table(capacity, items):
+    # type: (int, int) -> bool
+    # The control bytes of a table are read at once, so an uninitialized table must not make the debugger
+    # allocate an arbitrarily large buffer. The number of buckets of a hashbrown table is a power of two
+    return 0 < capacity <= HASH_TABLE_CAPACITY_LIMIT and capacity & (capacity - 1) == 0 and items <= capacity